@@ -431,7 +431,7 @@ class WatChMaLClassification(ClassificationRun, WatChMaLOutput):
             Array of boolean values indicating whether each entry had the best validation loss so far in the training
             progression log
         """
-        super().read_training_log_from_csv(directory)
+        super().read_training_log_from_csv(directory, train_columns=(0, 1, 2, 3), val_columns=(0, 1, 2, 3))
         self._train_log_accuracy = np.mean(self._log_train[:, :, 3], axis=0)
         self._val_log_loss = self._log_val[:, 1]
         self._val_log_accuracy = self._log_val[:, 2]
@@ -512,7 +512,7 @@ class WatChMaLClassification(ClassificationRun, WatChMaLOutput):
 
     @property
     def softmaxes(self):
-        """Array of softmax outputs"""
+        """Read-only array of softmax outputs"""
         if self._softmaxes is None:
             self._softmaxes = self.get_outputs("softmax")
         return self._softmaxes
@@ -100,27 +100,39 @@ class WatChMaLOutput(ABC, metaclass=ABCMeta):
         Returns
         -------
         np.ndarray
-            Two dimensional array of predicted softmax values, where each row corresponds to an event and each column
-            contains the softmax values of a class.
+            Two dimensional read-only array of predicted softmax values, where each row corresponds to an event and each
+            column contains the softmax values of a class.
         """
-        outputs = np.load(self.directory + "/outputs/" + name + ".npy")
+        # the outputs are memory-mapped, so that if they are already sorted by their indices and all events are used,
+        # only the parts of the file actually used are read
+        outputs = np.load(self.directory + "/outputs/" + name + ".npy", mmap_mode='r')
         output_indices = np.load(self.directory + "/outputs/indices.npy")
         if self.indices is None:
-            return outputs[output_indices.argsort()].squeeze()
-        intersection = np.intersect1d(self.indices, output_indices, return_indices=True)
-        sorted_outputs = np.zeros(self.indices.shape + outputs.shape[1:])
-        sorted_outputs[intersection[1]] = outputs[intersection[2]]
+            if np.all(output_indices[1:] > output_indices[:-1]):
+                return outputs.squeeze()
+            sorted_outputs = outputs[output_indices.argsort()]
+        else:
+            intersection = np.intersect1d(self.indices, output_indices, return_indices=True)
+            sorted_outputs = np.zeros(self.indices.shape + outputs.shape[1:])
+            sorted_outputs[intersection[1]] = outputs[intersection[2]]
+        # the outputs are read-only whether or not they are memory-mapped, so that they can be used the same way
+        sorted_outputs.setflags(write=False)
         return sorted_outputs.squeeze()
 
     @abstractmethod
-    def read_training_log_from_csv(self, directory):
+    def read_training_log_from_csv(self, directory, train_columns=(0, 1, 2), val_columns=(0,)):
         """
-        Read the training progression logs from the given directory.
+        Read the training progression logs from the given directory. Only the given columns of the logs are read, in
+        the given order.
 
         Parameters
         ----------
         directory: str
             Path to the directory of the training run.
+        train_columns: sequence of int, optional
+            Columns of the training logs to read, starting with the iteration, epoch and loss columns.
+        val_columns: sequence of int, optional
+            Columns of the validation log to read, starting with the iteration column.
 
         Returns
         -------
@@ -128,13 +140,16 @@ class WatChMaLOutput(ABC, metaclass=ABCMeta):
             Tuple of arrays of training progression log values, see `read_training_log_from_csv` for details.
         """
         train_files = glob.glob(directory + "/outputs/log_train*.csv")
-        self._log_train = np.array([np.genfromtxt(f, delimiter=',', skip_header=1) for f in train_files])
-        self._log_val = np.genfromtxt(directory + "/outputs/log_val.csv", delimiter=',', skip_header=1)
+        self._log_train = np.stack([np.loadtxt(f, delimiter=',', skiprows=1, ndmin=2, dtype=np.float32,
+                                               usecols=train_columns)
+                                    for f in train_files])
+        self._log_val = np.loadtxt(directory + "/outputs/log_val.csv", delimiter=',', skiprows=1, ndmin=2,
+                                   dtype=np.float32, usecols=val_columns)
         train_iteration = self._log_train[0, :, 0]
         train_epoch = self._log_train[0, :, 1]
         it_per_epoch = np.min(train_iteration[train_epoch == 1]) - 1
         self._train_log_epoch = train_iteration / it_per_epoch
-        self._train_log_loss = np.mean(self._log_train[:, :, 2], axis=0)
+        self._train_log_loss = np.mean(self._log_train[:, :, 2], axis=0, dtype=np.float32)
         self._val_log_epoch = self._log_val[:, 0] / it_per_epoch
 
     @property
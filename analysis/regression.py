@@ -1,11 +1,14 @@
+import os
+import warnings
 import numpy as np
 import tabulate
 import matplotlib.pyplot as plt
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from analysis.read import WatChMaLOutput
 import analysis.utils.math as math
 import analysis.utils.binning as bins
-from analysis.utils.plotting import plot_binned_values
+from analysis.utils.plotting import plot_binned_statistic
 
 
 def plot_histograms(runs, quantity, selection=None, ax=None, fig_size=None, x_label="", y_label="", legend='best', **hist_args):
@@ -33,7 +36,8 @@ def plot_histograms(runs, quantity, selection=None, ax=None, fig_size=None, x_la
         Position of the legend, or None to have no legend. Attempts to find the best position by default.
     hist_args: optional
         Additional arguments to pass to the `hist` plotting function. Note that these may be overridden by arguments
-        provided in `runs`.
+        provided in `runs`. By default, the histogram range is set to span the values of all runs, so that every run is
+        histogrammed with the same bin edges.
 
     Returns
     -------
@@ -48,12 +52,26 @@ def plot_histograms(runs, quantity, selection=None, ax=None, fig_size=None, x_la
         fig, ax = plt.subplots(figsize=fig_size)
     else:
         fig = ax.get_figure()
-    for r in runs:
-        if selection is None:
-            run_selection = r.selection if selection is None else selection
-        data = r.get_quantity(quantity)[run_selection].flatten()
-        args = {**hist_args, **r.plot_args}
-        ax.hist(data, **args)
+    get_quantity = _quantity_getter(quantity)
+    data = _map_runs(lambda r: get_quantity(r)[r.selection if selection is None else selection].ravel(), runs)
+    non_empty = [d for d in data if d.size > 0]
+    if non_empty and np.ndim(hist_args['bins']) == 0:
+        # ignore NaN values, which `hist` drops, and leave the range unset if no run has any finite values
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            value_range = (np.nanmin([np.nanmin(d) for d in non_empty]), np.nanmax([np.nanmax(d) for d in non_empty]))
+        if np.all(np.isfinite(value_range)):
+            hist_args.setdefault('range', value_range)
+    # if the runs' plot arguments only set properties that `hist` accepts per dataset, histogram them all in one call,
+    # unless drawing bars, which `hist` would place side by side or stacked for multiple datasets instead of overlaid
+    run_arg_keys = {frozenset(r.plot_args) for r in runs}
+    if (hist_args['histtype'] in ('step', 'stepfilled') and len(run_arg_keys) == 1
+            and run_arg_keys.pop() <= {'label', 'color'}):
+        per_run_args = {k: [r.plot_args[k] for r in runs] for k in runs[0].plot_args}
+        ax.hist(data, **{**hist_args, **per_run_args})
+    else:
+        for r, d in zip(runs, data):
+            ax.hist(d, **{**hist_args, **r.plot_args})
     ax.set_xlabel(x_label)
     ax.set_ylabel(y_label)
     if legend:
@@ -106,6 +124,8 @@ def plot_resolution_profile(runs, quantity, binning, selection=None, ax=None, fi
         fig, ax = plt.subplots(figsize=fig_size)
     else:
         fig = ax.get_figure()
+    # bin the runs' values in parallel, the plotting below then uses each run's cached binned values
+    _map_runs(lambda r: r._get_binned(quantity, binning, r.selection if selection is None else selection), runs)
     for r in runs:
         args = {**plot_args, **r.plot_args}
         r.plot_binned_resolution(quantity, ax, binning, selection, **args)
@@ -163,6 +183,8 @@ def plot_bias_profile(runs, quantity, binning, selection=None, ax=None, fig_size
         fig, ax = plt.subplots(figsize=fig_size)
     else:
         fig = ax.get_figure()
+    # bin the runs' values in parallel, the plotting below then uses each run's cached binned values
+    _map_runs(lambda r: r._get_binned(quantity, binning, r.selection if selection is None else selection), runs)
     for r in runs:
         args = {**plot_args, **r.plot_args}
         r.plot_binned_bias(quantity, ax, binning, selection, **args)
@@ -215,7 +237,7 @@ def tabulate_statistics(runs, quantities, stat_labels, statistic="resolution", s
         stat_labels = [stat_labels]
     run_labels = [r.run_label for r in runs]
     statistic_map = {
-        "resolution": lambda x:  np.quantile(np.abs(x), 0.68),
+        "resolution": math.resolution,
         "mean": lambda x: np.mean(x),
     }
     if isinstance(statistic, str):
@@ -228,7 +250,8 @@ def tabulate_statistics(runs, quantities, stat_labels, statistic="resolution", s
                      for stat in statistic]
     data = []
     for f, q in zip(functions, quantities):
-        data.append([f(r.get_quantity(q)[r.selection if selection is None else selection]) for r in runs])
+        get_quantity = _quantity_getter(q)
+        data.append([f(get_quantity(r)[r.selection if selection is None else selection]) for r in runs])
     if transpose:
         data = list(zip(*data))
         return tabulate.tabulate(data, headers=stat_labels, showindex=run_labels, **tabulate_args)
@@ -236,6 +259,47 @@ def tabulate_statistics(runs, quantities, stat_labels, statistic="resolution", s
         return tabulate.tabulate(data, headers=run_labels, showindex=stat_labels, **tabulate_args)
 
 
+def _quantity_getter(quantity):
+    """
+    Return a function that takes a run and returns its values of `quantity`, as `RegressionRun.get_quantity` does, so
+    that the type of the quantity is only checked once when getting it from many runs.
+    """
+    if isinstance(quantity, str):
+        return lambda r: r._get_attribute(quantity)
+    elif callable(quantity):
+        return quantity
+    else:
+        raise TypeError("The quantity should be a string or function")
+
+
+def _selection_indices(total, indices):
+    """
+    Return the integer indices of the elements selected by indexing the first axis of an array of length `total` with
+    `indices`, or None if `indices` is Ellipsis and selects every element, without allocating an array of length
+    `total`.
+    """
+    if indices is Ellipsis:
+        return None
+    if isinstance(indices, slice):
+        return np.arange(*indices.indices(total))
+    indices = np.asarray(indices)
+    if indices.dtype == bool:
+        return np.flatnonzero(indices)
+    return indices
+
+
+def _map_runs(function, runs):
+    """
+    Apply a function to each of a sequence of runs, returning the list of results. The runs are processed in a thread
+    pool, since getting and binning their quantities is mostly done in NumPy, which releases the GIL.
+    """
+    runs = list(runs)
+    if len(runs) < 2:
+        return [function(r) for r in runs]
+    with ThreadPoolExecutor(max_workers=min(len(runs), os.cpu_count() or 1)) as executor:
+        return list(executor.map(function, runs))
+
+
 class RegressionRun(ABC):
     """
     Base class for regression results
@@ -261,6 +325,8 @@ class RegressionRun(ABC):
         self.run_label = run_label
         plot_args['label'] = run_label
         self.plot_args = plot_args
+        self._quantity_cache = {}
+        self._binned_cache = {}
 
     def get_quantity(self, quantity):
         """
@@ -279,12 +345,35 @@ class RegressionRun(ABC):
         np.ndarray:
             One-dimensional array of values corresponding to the desired quantity
         """
-        if isinstance(quantity, str):
-            return getattr(self, quantity)
-        elif callable(quantity):
-            return quantity(self)
-        else:
-            raise TypeError("The quantity should be a string or function")
+        return _quantity_getter(quantity)(self)
+
+    def _get_attribute(self, name):
+        """Return an attribute of the run results, caching it so that later calls need only a dictionary lookup."""
+        # only attributes are cached, so the cache cannot grow beyond one entry per attribute
+        if name not in self._quantity_cache:
+            self._quantity_cache[name] = getattr(self, name)
+        return self._quantity_cache[name]
+
+    def clear_cache(self):
+        """Clear the cached quantities and binned values, e.g. after modifying attributes of the run results."""
+        self._quantity_cache.clear()
+        self._binned_cache.clear()
+
+    def _get_binned(self, quantity, binning, selection):
+        """
+        Return the values of a quantity divided up into bins, as returned by `analysis.utils.binning.apply_binning`,
+        reusing the result of the previous call with the same quantity, binning and selection. Only the most recent
+        binning and selection is kept for each attribute, and for functions only the most recent function is kept.
+        """
+        key = quantity if isinstance(quantity, str) else None
+        cached = self._binned_cache.get(key)
+        # the cached binned values are only reused for the same function, bin indices and selection objects
+        if (cached is not None and (key is not None or cached[0] is quantity)
+                and cached[1] is binning[1] and cached[2] is selection):
+            return cached[3]
+        binned_values = bins.apply_binning(self.get_quantity(quantity), binning, selection)
+        self._binned_cache[key] = (quantity, binning[1], selection, binned_values)
+        return binned_values
 
     def plot_binned_resolution(self, quantity, ax, binning, selection=None, errors=False, x_errors=True, **plot_args):
         """
@@ -315,8 +404,9 @@ class RegressionRun(ABC):
         """
         if selection is None:
             selection = self.selection
-        values = self.get_quantity(quantity)
-        return plot_binned_values(ax, bins.binned_resolutions, values, binning, selection, errors, x_errors, **plot_args)
+        binned_values = self._get_binned(quantity, binning, selection)
+        return plot_binned_statistic(ax, bins.binned_resolutions, binned_values, binning[0], errors, x_errors,
+                                     **plot_args)
 
     def plot_binned_bias(self, quantity, ax, binning, selection=None, errors=False, x_errors=True, **plot_args):
         """
@@ -346,8 +436,8 @@ class RegressionRun(ABC):
         """
         if selection is None:
             selection = self.selection
-        values = self.get_quantity(quantity)
-        return plot_binned_values(ax, bins.binned_mean, values, binning, selection, errors, x_errors, **plot_args)
+        binned_values = self._get_binned(quantity, binning, selection)
+        return plot_binned_statistic(ax, bins.binned_mean, binned_values, binning[0], errors, x_errors, **plot_args)
 
 
 class MomentumPrediction(ABC):
@@ -363,6 +453,9 @@ class MomentumPrediction(ABC):
     `momentum_fractional_errors`    `momentum_residuals` divided by the true momentum
     `energy_fractional_errors`      `energy_residuals` divided by the true energy
     ===================================================================================================================
+
+    These attributes are stored as 32-bit floats, to halve the memory used by the arrays and the time taken to histogram
+    and bin them. The energy attributes are only calculated when first used.
     """
     def __init__(self, true_momenta=None, true_labels=None):
         """
@@ -377,22 +470,46 @@ class MomentumPrediction(ABC):
         """
         self.true_labels = true_labels
         self.true_momenta = true_momenta
-        self.true_energies = None
         self.momentum_residuals = None
-        self.energy_residuals = None
+        self._true_energies = None
+        self._energy_residuals = None
+        self._energy_fractional_errors = None
         if true_momenta is not None:
-            self.momentum_residuals = self.momentum_prediction - self.true_momenta
-            self.momentum_fractional_errors = self.momentum_residuals/self.true_momenta
-            if true_labels is not None:
-                self.true_energies = math.energy_from_momentum(true_momenta, true_labels)
-                self.energy_residuals = self.energy_prediction - self.true_energies
-                self.energy_fractional_errors = self.energy_residuals/self.true_energies
+            momentum_residuals = self.momentum_prediction - self.true_momenta
+            self.momentum_fractional_errors = (momentum_residuals/self.true_momenta).astype(np.float32, copy=False)
+            self.momentum_residuals = momentum_residuals.astype(np.float32, copy=False)
 
     @property
     @abstractmethod
     def momentum_prediction(self):
         """This attribute gives the predicted momenta"""
 
+    @property
+    def true_energies(self):
+        """True energies calculated from the true momenta and true particle type labels, if both are provided"""
+        if self._true_energies is None and self.true_momenta is not None and self.true_labels is not None:
+            self._true_energies = math.energy_from_momentum(self.true_momenta, self.true_labels)
+        return self._true_energies
+
+    @property
+    def energy_residuals(self):
+        """Residuals of the energy prediction, if the true momenta and true particle type labels are provided"""
+        self._calculate_energy_errors()
+        return self._energy_residuals
+
+    @property
+    def energy_fractional_errors(self):
+        """Fractional errors of the energy prediction, if the true momenta and true particle type labels are provided"""
+        self._calculate_energy_errors()
+        return self._energy_fractional_errors
+
+    def _calculate_energy_errors(self):
+        """Calculate the energy residuals and fractional errors together, if not already calculated"""
+        if self._energy_residuals is None and self.true_energies is not None:
+            energy_residuals = self.energy_prediction - self.true_energies
+            self._energy_fractional_errors = (energy_residuals/self.true_energies).astype(np.float32, copy=False)
+            self._energy_residuals = energy_residuals.astype(np.float32, copy=False)
+
     @property
     def energy_prediction(self):
         """Energy prediction calculated from the momentum prediction and true particle type label"""
@@ -415,6 +532,9 @@ class PositionPrediction(ABC):
     `position_transverse_errors`    2D distance between the true and reconstructed position perpendicular to the
                                     particle's true direction
     ============================================================================================================
+
+    These attributes are stored as 32-bit floats, to halve the memory used by the arrays and the time taken to histogram
+    and bin them.
     """
     def __init__(self, true_positions=None, true_directions=None):
         """
@@ -439,13 +559,20 @@ class PositionPrediction(ABC):
         self.position_longitudinal_errors = None
         self.position_transverse_errors = None
         if true_positions is not None:
-            self.position_residuals = self.position_prediction - self.true_positions
+            prediction = np.asarray(self.position_prediction)
+            truth = np.asarray(true_positions)
+            # store residuals in column-major order so that each of the x, y, z residual views is contiguous in memory,
+            # which speeds up per-component reductions and binning, at the cost of a slightly slower subtraction here
+            residuals = np.empty(np.broadcast_shapes(prediction.shape, truth.shape), dtype=np.float32, order='F')
+            self.position_residuals = np.subtract(prediction, truth, out=residuals)
             self.x_residuals = self.position_residuals[:, 0]
             self.y_residuals = self.position_residuals[:, 1]
             self.z_residuals = self.position_residuals[:, 2]
             if true_directions is not None:
                 (self.position_3d_errors, self.position_longitudinal_errors,
-                 self.position_transverse_errors) = math.decompose_along_direction(self.position_residuals, true_directions)
+                 self.position_transverse_errors) = (
+                    e.astype(np.float32, copy=False)
+                    for e in math.decompose_along_direction(self.position_residuals, true_directions))
             else:
                 self.position_3d_errors = np.linalg.norm(self.position_residuals, axis=-1)
 
@@ -464,6 +591,9 @@ class DirectionPrediction(ABC):
     ===============================================================================================
     `direction_errors`              Angle between the true and reconstructed directions, in degrees
     ===============================================================================================
+
+    This attribute is stored as 32-bit floats, to halve the memory used by the array and the time taken to histogram and
+    bin it.
     """
     def __init__(self, true_directions=None):
         """
@@ -477,7 +607,10 @@ class DirectionPrediction(ABC):
         self.true_directions = true_directions
         self.direction_errors = None
         if true_directions is not None:
-            self.direction_errors = math.angle_between_directions(self.direction_prediction, true_directions, degrees=True)
+            # calculate the angles at the precision of the inputs before storing them at reduced precision, since the
+            # arccos of the dot product loses precision at small angles
+            self.direction_errors = math.angle_between_directions(self.direction_prediction, true_directions,
+                                                                  degrees=True).astype(np.float32, copy=False)
 
     @property
     @abstractmethod
@@ -522,50 +655,68 @@ class FitQun1ParticleFit(RegressionRun, PositionPrediction, DirectionPrediction,
         """
         RegressionRun.__init__(self, run_label=run_label, selection=selection, **plot_args)
         self.fitqun_output = fitqun_output
-        self.n_events = len(np.empty(len(fitqun_output.chain))[indices])
+        # indices of the selected events in the fiTQun output, so that each particle type's fit results can be read
+        # for only the events of that type
+        self._event_indices = _selection_indices(len(fitqun_output.chain), indices)
+        self.n_events = len(fitqun_output.chain) if self._event_indices is None else self._event_indices.size
         if isinstance(true_labels, int):
             true_labels = np.repeat(true_labels, self.n_events)
         self.true_labels = true_labels
         if particle_label_map is None:
             particle_label_map = {'gamma': 0, 'electron': 1, 'muon': 2, 'pi0': 3}
         self.particle_label_map = particle_label_map
-        self.label_set = set(true_labels)
-        self.particle_indices = {p: (true_labels == l) for p, l in particle_label_map.items() if l in self.label_set}
+        # find the indices of the events with each label, as integer arrays rather than boolean masks, which are used
+        # directly to fill each particle type's events in the predictions, without any conversion from mask to indices
+        self.label_set = set(np.unique(true_labels).tolist())
+        self.particle_indices = {p: np.flatnonzero(np.equal(true_labels, l))
+                                 for p, l in particle_label_map.items() if l in self.label_set}
+        self._all_events_covered = sum(i.size for i in self.particle_indices.values()) == self.n_events
         self._momentum_prediction = None
         self._position_prediction = None
         self._direction_prediction = None
-        # use lambdas to delay prevent reading all the data until/unless it's actually used
+        # use lambdas taking the events' indices in the fiTQun output, to delay reading data until it's actually used
         self.momentum_map = {
-            'gamma': lambda: self.fitqun_output.electron_momentum[indices],
-            'electron': lambda: self.fitqun_output.electron_momentum[indices],
-            'muon': lambda: self.fitqun_output.muon_momentum[indices],
-            'pi0': lambda: self.fitqun_output.pi0_momentum[indices],
+            'gamma': lambda i: self.fitqun_output.electron_momentum[i],
+            'electron': lambda i: self.fitqun_output.electron_momentum[i],
+            'muon': lambda i: self.fitqun_output.muon_momentum[i],
+            'pi0': lambda i: self.fitqun_output.pi0_momentum[i],
         }
         self.position_map = {
-            'gamma': lambda: self.fitqun_output.electron_position[indices],
-            'electron': lambda: self.fitqun_output.electron_position[indices],
-            'muon': lambda: self.fitqun_output.muon_position[indices],
-            'pi0': lambda: self.fitqun_output.pi0_position[indices],
+            'gamma': lambda i: self.fitqun_output.electron_position[i],
+            'electron': lambda i: self.fitqun_output.electron_position[i],
+            'muon': lambda i: self.fitqun_output.muon_position[i],
+            'pi0': lambda i: self.fitqun_output.pi0_position[i],
         }
         self.direction_map = {
-            'gamma': lambda: self.fitqun_output.electron_direction[indices],
-            'electron': lambda: self.fitqun_output.electron_direction[indices],
-            'muon': lambda: self.fitqun_output.muon_direction[indices],
-            'pi0': lambda: self.fitqun_output.pi0_direction[indices],
+            'gamma': lambda i: self.fitqun_output.electron_direction[i],
+            'electron': lambda i: self.fitqun_output.electron_direction[i],
+            'muon': lambda i: self.fitqun_output.muon_direction[i],
+            'pi0': lambda i: self.fitqun_output.pi0_direction[i],
         }
         PositionPrediction.__init__(self, true_positions=true_positions, true_directions=true_directions)
         DirectionPrediction.__init__(self, true_directions=true_directions)
         MomentumPrediction.__init__(self, true_labels=true_labels, true_momenta=true_momenta)
 
+    def _gather_prediction(self, prediction_map, shape):
+        """
+        Gather the prediction for each event from the fit of the event's particle type, reading each particle type's fit
+        results for only the events of that type, with zeros for events whose particle type is not in
+        `particle_indices`.
+        """
+        # only zero-fill the array if some events are not filled from a fit
+        prediction = np.empty(shape) if self._all_events_covered else np.zeros(shape)
+        for p, i in self.particle_indices.items():
+            event_indices = i if self._event_indices is None else self._event_indices[i]
+            prediction[i] = prediction_map[p](event_indices)
+        return prediction
+
     @property
     def momentum_prediction(self):
         """
         Momentum prediction from fiTQun for the single particle fit of the particle type(s) set during construction
         """
         if self._momentum_prediction is None:
-            self._momentum_prediction = np.zeros(self.n_events)
-            for p, i in self.particle_indices.items():
-                self._momentum_prediction[i] = self.momentum_map[p]()
+            self._momentum_prediction = self._gather_prediction(self.momentum_map, (self.n_events,))
         return self._momentum_prediction
 
     @property
@@ -574,9 +725,7 @@ class FitQun1ParticleFit(RegressionRun, PositionPrediction, DirectionPrediction,
         Position prediction from fiTQun for the single particle fit of the particle type(s) set during construction
         """
         if self._position_prediction is None:
-            self._position_prediction = np.zeros((self.n_events, 3))
-            for p, i in self.particle_indices.items():
-                self._position_prediction[i] = self.position_map[p]()
+            self._position_prediction = self._gather_prediction(self.position_map, (self.n_events, 3))
         return self._position_prediction
 
     @property
@@ -585,9 +734,7 @@ class FitQun1ParticleFit(RegressionRun, PositionPrediction, DirectionPrediction,
         Direction prediction from fiTQun for the single particle fit of the particle type(s) set during construction
         """
         if self._direction_prediction is None:
-            self._direction_prediction = np.zeros((self.n_events, 3))
-            for p, i in self.particle_indices.items():
-                self._direction_prediction[i] = self.direction_map[p]()
+            self._direction_prediction = self._gather_prediction(self.direction_map, (self.n_events, 3))
         return self._direction_prediction
 
 
@@ -640,14 +787,14 @@ class WatChMaLRegression(RegressionRun, WatChMaLOutput, ABC):
             Array of boolean values indicating whether each entry had the best validation loss so far in the training
             progression log
         """
-        super().read_training_log_from_csv(directory)
-        self._val_log_loss = self._log_val[:, 2]
-        self._val_log_best = self._log_val[:, 3].astype(bool)
+        super().read_training_log_from_csv(directory, val_columns=(0, 2, 3))
+        self._val_log_loss = self._log_val[:, 1]
+        self._val_log_best = self._log_val[:, 2].astype(bool)
         return self._train_log_epoch, self._train_log_loss, self._val_log_epoch, self._val_log_loss, self._val_log_best
 
     @property
     def predictions(self):
-        """Predictions output from the WatChMaL regression run"""
+        """Read-only array of predictions output from the WatChMaL regression run"""
         if self._predictions is None:
             self._predictions = self.get_outputs("predictions")
         return self._predictions
@@ -797,6 +944,7 @@ class CombinedRegressionRun(RegressionRun):
             together with other runs' results. By default, use the plot arguments of the first of the combined runs.
         """
         self.runs = combined_runs
+        self._attribute_runs = {}
         first_run = next(iter(combined_runs))
         if run_label is None:
             run_label = first_run.run_label
@@ -807,8 +955,16 @@ class CombinedRegressionRun(RegressionRun):
         RegressionRun.__init__(self, run_label=run_label, selection=selection, **plot_args)
 
     def __getattr__(self, attr):
+        # Use the run previously found to provide the attribute, if there is one.
+        run = self.__dict__.get('_attribute_runs', {}).get(attr)
+        if run is not None:
+            return getattr(run, attr)
         # Loop over the combined runs and look for the attribute in each, or raise exception if it's not found in any.
-        for r in self.runs:
-            if hasattr(r, attr):
-                return getattr(r, attr)
+        for r in self.__dict__.get('runs', ()):
+            try:
+                value = getattr(r, attr)
+            except AttributeError:
+                continue
+            self._attribute_runs[attr] = r
+            return value
         raise AttributeError(attr)
@@ -2,7 +2,7 @@
 Utility functions for binning events in some quantity and manipulating other quantities based on the binning
 """
 import numpy as np
-from analysis.utils.math import binomial_error
+from analysis.utils.math import binomial_error, resolution
 
 
 def get_binning(x, bins=None, minimum=None, maximum=None, width=None):
@@ -41,10 +41,52 @@ def get_binning(x, bins=None, minimum=None, maximum=None, width=None):
             bin_array = np.arange(minimum, maximum+width, width)
         else:
             bin_array = np.linspace(minimum, maximum, bins+1)
-    indices = np.digitize(x, bin_array)
+    if is_uniform(bin_array):
+        indices = digitize_uniform(x, bin_array)
+    else:
+        indices = np.digitize(x, bin_array)
     return bin_array, indices
 
 
+def is_uniform(bins):
+    """Whether an array of bin edges is increasing with equal-width bins"""
+    if bins.size < 2 or not bins[-1] > bins[0]:
+        return False
+    widths = np.diff(bins)
+    return np.allclose(widths, (bins[-1]-bins[0])/(bins.size-1), rtol=1e-6, atol=0)
+
+
+def digitize_uniform(x, bins):
+    """
+    Equivalent of `np.digitize` for increasing bins of equal width. The bin index of each value is calculated directly
+    from the bin width rather than by searching the bin edges, then corrected for any floating point rounding at the
+    edges so that the result is identical to `np.digitize`.
+
+    Parameters
+    ----------
+    x: array_like
+        Input array to be binned.
+    bins: np.ndarray
+        Array of equal-width bin edges, in increasing order.
+
+    Returns
+    -------
+    np.ndarray
+        Output array of indices, of same shape as x
+    """
+    x = np.asarray(x)
+    n_edges = bins.size
+    scaled = (x - bins[0]) * ((n_edges-1) / (bins[-1]-bins[0]))
+    indices = np.fmin(np.fmax(np.floor(scaled), -1), n_edges-1).astype(np.intp) + 1
+    padded_bins = np.concatenate(([-np.inf], bins, [np.inf]))
+    indices -= x < padded_bins[indices]
+    indices += x >= padded_bins[indices+1]
+    if np.issubdtype(x.dtype, np.floating):
+        np.minimum(indices, n_edges, out=indices)
+        indices[np.isnan(x)] = n_edges
+    return indices
+
+
 def apply_binning(values, binning, selection=...):
     """
     This function bins values according to the indices returned by `get_binning`. Returns a list of arrays where the nth
@@ -69,7 +111,11 @@ def apply_binning(values, binning, selection=...):
     """
     data = values[selection]
     data_bins = binning[1][selection]
-    return [data[data_bins == b] for b in range(1, binning[0].size)]
+    # sort the values by bin once and split into the bins, rather than searching all values for each bin
+    bin_order = np.argsort(data_bins, kind='stable')
+    bin_ends = np.cumsum(np.bincount(data_bins, minlength=binning[0].size))
+    sorted_data = data[bin_order]
+    return [sorted_data[bin_ends[b-1]:bin_ends[b]] for b in range(1, binning[0].size)]
 
 
 def unapply_binning(binned_values, binning, selection=...):
@@ -121,8 +167,8 @@ def binned_resolutions(binned_residuals, return_errors=True):
         array of standard errors on the means of the residuals
     """
     try:
-        resolutions = np.array([np.quantile(np.abs(x), 0.68) for x in binned_residuals])
-    except IndexError as ex:
+        resolutions = np.array([resolution(x) for x in binned_residuals])
+    except ValueError as ex:
         raise ValueError("Attempted to calculate resolution in a bin with no entries.") from ex
     if return_errors:
         errors = binned_std_errors(binned_residuals)
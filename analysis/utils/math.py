@@ -207,10 +207,14 @@ def angle_between_directions(direction1, direction2, degrees=False):
     angle: np.ndarray or scalar
         array of angles between direction1 and direction2, or scalar if direction1 and direction2 are single directions
     """
-    angle = np.arccos(np.clip(np.einsum('...i,...i', direction1, direction2), -1.0, 1.0))
+    # operate in place on the array of dot products to avoid allocating a temporary array at each step
+    angle = np.einsum('...i,...i', direction1, direction2)
+    angle = np.asarray(angle, dtype=np.result_type(angle, 1.0))
+    np.clip(angle, -1.0, 1.0, out=angle)
+    np.arccos(angle, out=angle)
     if degrees:
-        angle *= 180/np.pi
-    return angle
+        np.degrees(angle, out=angle)
+    return angle[()]
 
 
 def decompose_along_direction(vector, direction):
@@ -233,10 +237,68 @@ def decompose_along_direction(vector, direction):
     transverse_component: np.ndarray or scalar
         array of component of each vector transverse to direction, or scalar if only one vector
     """
-    total_magnitude = np.linalg.norm(vector, axis=-1)
+    vector = np.asarray(vector)
+    direction = np.asarray(direction)
+    # use the squared magnitude directly and operate in place to avoid allocating a temporary array at each step
+    squared_magnitude = np.einsum('...i,...i', vector, vector, dtype=np.result_type(vector, direction))
+    total_magnitude = np.sqrt(squared_magnitude)
     longitudinal_component = np.einsum('...i,...i', vector, direction)
-    transverse_component = np.sqrt(np.maximum(total_magnitude**2-longitudinal_component**2, 0))
-    return total_magnitude, longitudinal_component, transverse_component
+    longitudinal_component = np.asarray(longitudinal_component, dtype=np.result_type(longitudinal_component, 1.0))
+    transverse_component = np.square(longitudinal_component, out=np.empty_like(longitudinal_component))
+    np.subtract(squared_magnitude, transverse_component, out=transverse_component)
+    np.maximum(transverse_component, 0, out=transverse_component)
+    np.sqrt(transverse_component, out=transverse_component)
+    return total_magnitude[()], longitudinal_component[()], transverse_component[()]
+
+
+def resolution(residuals, quantile=0.68, axis=None, overwrite_input=False):
+    """
+    Calculate resolution defined as the 68th percentile (or other quantile) of the absolute residuals. This gives the
+    same result as `np.quantile(np.abs(residuals), quantile, axis)` but partially sorts a single copy of the absolute
+    values in place, instead of making a further copy to find the quantile.
+
+    Parameters
+    ----------
+    residuals: array_like
+        array of float residuals
+    quantile: float, default: 0.68
+        quantile of the absolute residuals to use as the resolution
+    axis: int, optional
+        axis along which to calculate the resolution (by default use the flattened array)
+    overwrite_input: bool, default: False
+        if True, and `residuals` is a float array, take the absolute values and partially sort them in place in
+        `residuals` instead of in a copy, leaving its contents undefined
+
+    Returns
+    -------
+    np.ndarray or scalar
+        resolution of the residuals, or array of resolutions along the given axis
+    """
+    if overwrite_input and isinstance(residuals, np.ndarray) and np.issubdtype(residuals.dtype, np.floating):
+        abs_residuals = np.abs(residuals, out=residuals)
+    else:
+        abs_residuals = np.abs(residuals)
+    if axis is None:
+        abs_residuals = abs_residuals.reshape(-1)
+        axis = 0
+    size = abs_residuals.shape[axis]
+    if size == 0:
+        raise ValueError("Attempted to calculate resolution of an empty array.")
+    # partitioning moves NaNs to the end instead of propagating them, so find them first to give NaN like np.quantile
+    has_nan = np.issubdtype(abs_residuals.dtype, np.floating) and np.isnan(abs_residuals).any(axis=axis)
+    position = quantile*(size-1)
+    k = int(position)
+    fraction = position - k
+    if fraction == 0:
+        abs_residuals.partition(k, axis=axis)
+        result = np.take(abs_residuals, k, axis=axis)
+    else:
+        abs_residuals.partition((k, k+1), axis=axis)
+        lower = np.take(abs_residuals, k, axis=axis)
+        result = lower + fraction*(np.take(abs_residuals, k+1, axis=axis)-lower)
+    if np.any(has_nan):
+        result = np.where(has_nan, np.nan, result)[()]
+    return result
 
 
 def binomial_error(x):
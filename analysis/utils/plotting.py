@@ -79,12 +79,39 @@ def plot_binned_values(ax, func, values, binning, selection=None, errors=False,
         Additional arguments to pass to the plotting function. Note that these may be overridden by arguments
         provided in `runs`.
     """
-    plot_args.setdefault('lw', 2)
     binned_values = bins.apply_binning(values, binning, selection)
-    x = bins.bin_centres(binning[0])
+    plot_binned_statistic(ax, func, binned_values, binning[0], errors, x_errors, **plot_args)
+
+
+def plot_binned_statistic(ax, func, binned_values, bin_edges, errors=False, x_errors=True, **plot_args):
+    """
+    Plot a binned statistic for some values that have already been divided up into bins, on an existing set of axes.
+    The statistic function is applied to the values in each bin and the results, and optionally error bars (if errors
+    are provided by the statistic function), for each bin are plotted against the binning quantity on the x-axis.
+
+    Parameters
+    ----------
+    ax: matplotlib.axes.Axes
+        Axes to draw the plot.
+    func: callable
+        A function that takes the binned values as its first parameter and a boolean for whether to return errors as its
+        second parameter and returns the binned results and optional errors.
+    binned_values: list of np.ndarray
+        List of arrays of values assigned to each bin, as returned by `analysis.utils.binning.apply_binning`.
+    bin_edges: np.ndarray
+        Array of bin edges, returned from `analysis.utils.binning.get_binning`.
+    errors: bool, optional
+        If True, plot error bars calculated as the standard deviation divided by sqrt(N) of the N values in the bin.
+    x_errors: bool, optional
+        If True, plot horizontal error bars corresponding to the width of the bin, only if `errors` is also True.
+    plot_args: optional
+        Additional arguments to pass to the plotting function.
+    """
+    plot_args.setdefault('lw', 2)
+    x = bins.bin_centres(bin_edges)
     if errors:
         y_values, y_errors = func(binned_values, errors)
-        x_errors = bins.bin_halfwidths(binning[0]) if x_errors else None
+        x_errors = bins.bin_halfwidths(bin_edges) if x_errors else None
         plot_args.setdefault('marker', '')
         plot_args.setdefault('capsize', 4)
         plot_args.setdefault('capthick', 2)